@@ -36,12 +36,412 @@ https://sites.google.com/view/yoshitakaogisu/
 import numpy as np
 import scipy.stats as stat
 import scipy.optimize as opt
-from scipy.sparse import csr_matrix
+from scipy.special import betainc
+from scipy.sparse import csr_matrix, issparse
+from scipy.sparse.linalg import LinearOperator
 from itertools import combinations
 import time
+from numba import njit, prange, config, get_num_threads, set_num_threads
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _residual(x, Adj_all, tau):
+    """
+    Function for optimization, H_i = sum_{j neq i} (A_ij - tau*x_i*x_j)/(1 - x_i*x_j)
+    """
+    N = len(x)
+    out = np.empty(N)
+    for i in prange(N):
+        s = 0.0
+        xi = x[i]
+        for j in range(N):
+            if j != i:
+                u = xi*x[j]
+                s += (Adj_all[i, j] - tau*u)/(1.0 - u)
+        out[i] = s
+    
+    return out
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _jacobian(x, Adj_all, tau, out):
+    """
+    Jacobian of the function for optimization
+    dH_i/dx_k = x_i*(A_ik - tau)/(1 - x_i*x_k)^2 for k neq i
+    dH_i/dx_i = sum_{k neq i} x_k*(A_ik - tau)/(1 - x_i*x_k)^2
+    """
+    N = len(x)
+    for i in prange(N):
+        d = 0.0
+        xi = x[i]
+        for k in range(N):
+            if k != i:
+                u = xi*x[k]
+                m = (Adj_all[i, k] - tau)/((1.0 - u)*(1.0 - u))
+                out[i, k] = xi*m
+                d += x[k]*m
+        out[i, i] = d
+    
+    return out
+
+
+@njit(parallel=True, nogil=True, fastmath=True, cache=True)
+def _residual_csr(x, indptr, indices, data, tau):
+    """
+    Function for optimization, where A is given by CSR arrays without diagonal elements
+    """
+    N = len(x)
+    out = np.empty(N)
+    for i in prange(N):
+        s = 0.0
+        xi = x[i]
+        ## tau*u/(1-u) term for all j neq i
+        for j in range(N):
+            if j != i:
+                u = xi*x[j]
+                s -= tau*u/(1.0 - u)
+        ## A/(1-u) term only for edges
+        for k in range(indptr[i], indptr[i+1]):
+            u = xi*x[indices[k]]
+            s += data[k]/(1.0 - u)
+        out[i] = s
+    
+    return out
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _jacobian_diag(x, Adj_all, tau):
+    """
+    Diagonal of the Jacobian, dH_i/dx_i = sum_{k neq i} x_k*(A_ik - tau)/(1 - x_i*x_k)^2
+    """
+    N = len(x)
+    out = np.empty(N)
+    for i in prange(N):
+        d = 0.0
+        xi = x[i]
+        for k in range(N):
+            if k != i:
+                u = xi*x[k]
+                d += x[k]*(Adj_all[i, k] - tau)/((1.0 - u)*(1.0 - u))
+        out[i] = d
+    
+    return out
+
+
+@njit(parallel=True, nogil=True, fastmath=True, cache=True)
+def _jacobian_diag_csr(x, indptr, indices, data, tau):
+    """
+    Diagonal of the Jacobian, where A is given by CSR arrays without diagonal elements
+    """
+    N = len(x)
+    out = np.empty(N)
+    for i in prange(N):
+        d = 0.0
+        xi = x[i]
+        ## -tau term for all k neq i
+        for k in range(N):
+            if k != i:
+                u = xi*x[k]
+                d -= x[k]*tau/((1.0 - u)*(1.0 - u))
+        ## A term only for edges
+        for k in range(indptr[i], indptr[i+1]):
+            xk = x[indices[k]]
+            u = xi*xk
+            d += xk*data[k]/((1.0 - u)*(1.0 - u))
+        out[i] = d
+    
+    return out
+
+
+class _JacobiPreconditioner(LinearOperator):
+    """
+    Preconditioner of Newton-Krylov method ('krylov'), inverse of the diagonal of the Jacobian.
+    The diagonal is computed at each nonlinear step without forming the Jacobian, 
+    so that the memory is O(N).
+    'scipy.optimize.root' approximates J*v of 'krylov' by a finite difference of one residual call 
+    and has no hook for an analytic J*v, so the analytic Jacobian can enter only as a preconditioner.
+    It costs one more O(N^2) pass per nonlinear step and is used only on request.
+    """
+    def __init__(self, jac_diag, args, N):
+        super().__init__(dtype=np.float64, shape=(N,N))
+        self.jac_diag = jac_diag
+        self.args = args
+        self.d = np.ones(N)
+    
+    def setup(self, x, f, func):
+        self.update(x, f)
+    
+    def update(self, x, f):
+        d = self.jac_diag(x, *self.args)
+        d[d == 0] = 1.0
+        self.d = d
+    
+    def _matvec(self, v):
+        return v.reshape(-1)/self.d
+
+
+def _krylov_options(options, jac_diag, args, N):
+    """
+    Replace jac_options['inner_M'] = 'jacobi' in options of 'krylov' by the Jacobi preconditioner.
+    """
+    jac_options = dict((options or {}).get('jac_options', {}))
+    inner_M = jac_options.get('inner_M')
+    if isinstance(inner_M, str) and inner_M == 'jacobi':
+        jac_options['inner_M'] = _JacobiPreconditioner(jac_diag, args, N)
+        options = dict(options, jac_options=jac_options)
+    
+    return options
+
+
+def _binom_sf(k, n, p, betainc_func=betainc, xp=np):
+    """
+    Survival function of binomial distribution P(X > k) = I_p(k+1, n-k), 
+    where I is the regularized incomplete beta function.
+    Same as 'scipy.stats.binom.sf' without the overhead of its argument handling.
+    xp is the array module of k and p (numpy or cupy).
+    """
+    k = xp.floor(k) # non-integer k is floored as in 'scipy.stats.binom.sf'
+    sf = xp.zeros_like(p) # P(X > k) = 0 for k >= n
+    lt = k < n
+    sf[lt] = betainc_func(k[lt]+1, n-k[lt], p[lt])
+    
+    return sf
+
+
+def _binom_sf_cupy(k, n, p):
+    """
+    Survival function of binomial distribution computed on GPU by CuPy.
+    """
+    import cupy as cp
+    from cupyx.scipy.special import betainc as cp_betainc
+    
+    sf = _binom_sf(cp.asarray(k), n, cp.asarray(p), betainc_func=cp_betainc, xp=cp)
+    
+    return cp.asnumpy(sf)
+
+
+def _count_dtype(A):
+    """
+    Single precision if A holds integer counts below 2^24, which are exact in float32 
+    and halve the memory traffic, otherwise double precision.
+    """
+    if not np.issubdtype(A.dtype, np.integer) and not np.array_equal(A, np.floor(A)):
+        return np.float64
+    
+    return np.float32 if np.max(np.abs(A), initial=0) < 2**24 else np.float64
+
+
+def _dense_funcs(Adj_all, tau):
+    """
+    Function for optimization, its Jacobian, diagonal of the Jacobian 
+    and their arguments for a dense adjacency matrix, compiled by Numba.
+    """
+    N = len(Adj_all)
+    ## the kernels compute in double precision whatever the dtype of the counts is
+    Adj_cnt = np.ascontiguousarray(Adj_all, dtype=_count_dtype(Adj_all))
+    J_buf = np.empty((N,N)) # reused over the iterations
+    
+    def jac_func(x, *args):
+        """
+        Jacobian of the function for optimization (args are passed to '_residual')
+        """
+        return _jacobian(x, Adj_cnt, tau, J_buf)
+    
+    return _residual, jac_func, _jacobian_diag, (Adj_cnt, tau)
+
+
+def _cupy_funcs(Adj_all, tau):
+    """
+    Function for optimization, its Jacobian and diagonal of the Jacobian
+    computed on GPU by CuPy.
+    The adjacency matrix is moved to the device once, and x and the results are 
+    moved between host and device at each call.
+    """
+    import cupy as cp
+    
+    Adj_dev = cp.asarray(Adj_all, dtype=_count_dtype(Adj_all))
+    
+    def obj_func(x, *args):
+        """
+        Function for optimization
+        """
+        x = cp.asarray(x)
+        u = cp.outer(x, x)
+        obj_mat = (Adj_dev - tau*u)/(1-u)
+        H = cp.sum(obj_mat, axis=1) - cp.diag(obj_mat) # sum up i neq j
+        return cp.asnumpy(H)
+    
+    def jac_matrix(x):
+        """
+        (A_ik - tau)/(1 - x_i*x_k)^2 for k neq i, shared by the Jacobian and its diagonal
+        """
+        u = cp.outer(x, x)
+        M = (Adj_dev - tau)/(1-u)**2
+        cp.fill_diagonal(M, 0)
+        return M
+    
+    def jac_func(x, *args):
+        """
+        Jacobian of the function for optimization
+        """
+        x = cp.asarray(x)
+        M = jac_matrix(x)
+        J = x.reshape(-1,1)*M
+        cp.fill_diagonal(J, M@x)
+        return cp.asnumpy(J)
+    
+    def jac_diag(x, *args):
+        """
+        Diagonal of the Jacobian
+        """
+        x = cp.asarray(x)
+        return cp.asnumpy(jac_matrix(x)@x)
+    
+    return obj_func, jac_func, jac_diag, ()
+
+
+def _sym_csr(e_list, N):
+    """
+    Symmetric sparse adjacency matrix summing up all edges in e_list.
+    Both directions of each edge are put in one COO to CSR conversion, 
+    so A + A.T is never formed.
+    """
+    row = np.concatenate([e_list[:,0], e_list[:,1]])
+    col = np.concatenate([e_list[:,1], e_list[:,0]])
+    data = np.ones(len(row))
+    
+    return csr_matrix((data, (row, col)), shape=(N,N))
+
+
+def _csr_args(A_sym):
+    """
+    CSR arrays of the sparse adjacency matrix without diagonal elements,
+    which are passed to '_residual_csr' and '_jacobian_diag_csr'.
+    A_sym itself is not modified.
+    """
+    N = A_sym.shape[0]
+    indptr, indices = A_sym.indptr, A_sym.indices
+    data = A_sym.data.astype(_count_dtype(A_sym.data))
+    data[np.repeat(np.arange(N), np.diff(indptr)) == indices] = 0
+    
+    return indptr, indices, data
+
+
+def _estimate(res_func, a0, args, opt_method, jac_func=None, jac_diag=None,
+              tol=None, options=None):
+    """
+    Estimate activity parameters by root finding of the function for optimization.
+    The Jacobian is used by 'hybr' and 'lm', and its diagonal can precondition 'krylov'.
+    """
+    jac = jac_func if opt_method in ('hybr', 'lm') else None
+    if opt_method == 'krylov' and jac_diag is not None:
+        options = _krylov_options(options, jac_diag, args, len(a0))
+    sol = opt.root(res_func, x0=a0, args=args, method=opt_method, jac=jac,
+                   tol=tol, options=options)
+    if sol.success == True:
+        print("Root finding method completed successfully.")
+    else:
+        print("Caution! Root finding method failed to find an appropriate solution.")
+        print("The solution could be wrong.")
+    
+    return sol.x
+
+
+def _solve(Adj_all, tau, alpha, judge='p_val', opt_method='krylov',
+           x0=None, tol=None, options=None, backend='numpy',
+           strict=False, strict_fallback=False):
+    """
+    Identifying significant ties from adjacency matrix summing up for all time,
+    shared by ST_filter, ST_filter_aat and ST_filter_list.
+    Adj_all is a dense 2D-array or a sparse matrix (CSR),
+    which is made dense only for p-values and output.
+    strict and strict_fallback choose p < alpha (True) or p <= alpha (False) 
+    for judge='p_val' and for an unknown judge, respectively.
+    """
+    N = Adj_all.shape[0]
+    A_deg = np.asarray(Adj_all.sum(axis=1)).reshape(-1)
+    ## the Jacobian of 'hybr' and 'lm' and the GPU need a dense matrix in any case
+    if issparse(Adj_all) and (backend == 'cupy' or opt_method in ('hybr', 'lm')):
+        Adj_all = Adj_all.toarray()
+    
+    if backend == 'cupy':
+        res_func, jac_func, jac_diag, args = _cupy_funcs(Adj_all, tau)
+        binom_sf = _binom_sf_cupy
+    else:
+        if backend != 'numpy':
+            print("Caution! 'backend' can take only 'numpy' or 'cupy'.")
+            print("Now we calculate on CPU by numpy.")
+        if issparse(Adj_all):
+            res_func, jac_func, jac_diag = _residual_csr, None, _jacobian_diag_csr
+            args = _csr_args(Adj_all) + (tau,)
+        else:
+            res_func, jac_func, jac_diag, args = _dense_funcs(Adj_all, tau)
+        binom_sf = _binom_sf
+    
+    ## configuration model for first guess
+    if x0 is None:
+        numer = A_deg/tau
+        denom = np.sqrt(np.sum(A_deg)/tau)
+        a0 = numer/denom
+    else: # warm start
+        a0 = np.asarray(x0, float)
+    
+    ## estimate activity parameters
+    activ_params = _estimate(res_func, a0, args, opt_method, jac_func, jac_diag,
+                             tol=tol, options=options)
+    
+    ## dense matrix is needed only for p-values and output
+    if issparse(Adj_all):
+        Adj_all = Adj_all.toarray()
+    
+    ## construct probability for upper triangle (i < j) as the matrix is symmetric
+    iu = np.triu_indices(N, k=1)
+    u_up = activ_params[iu[0]]*activ_params[iu[1]]
+    k_up = Adj_all[iu]
+    nz = k_up > 0 # node pairs having edges
+    
+    ## calculate p-values
+    p_mat = np.zeros((N,N))
+    p_up = np.full(len(u_up), np.nan) # nan for u outside [0, 1] as in binom.sf
+    in_dom = (u_up >= 0) & (u_up <= 1)
+    p_up[in_dom] = -np.expm1(tau*np.log1p(-u_up[in_dom])) # binom.sf at k=0 is 1-(1-u)^tau
+    p_up[nz] = binom_sf(k_up[nz], tau, u_up[nz])
+    p_mat[iu] = p_up
+    p_mat[iu[::-1]] = p_up # lower triangle in place instead of p_mat+p_mat.T
+    np.fill_diagonal(p_mat, np.nan) # diagonal is nan
+    
+    ## compute significant edges
+    ## on upper triangle, where node pairs without edge are insignificant
+    if judge in ('p_val', 'inv_binom'):
+        if judge == 'p_val':
+            sig_up = (p_up < alpha if strict else p_up <= alpha) & nz
+        else:
+            sig_up = np.zeros(len(k_up), bool)
+            sig_up[nz] = k_up[nz] > stat.binom.isf(q = alpha, n=tau, p=u_up[nz])
+        Adj_sig = np.zeros((N,N), int)
+        Adj_sig[iu] = sig_up
+        Adj_sig[iu[::-1]] = sig_up
+        if judge == 'inv_binom':
+            ## self-loops are judged on diagonal with u = x_i^2 (p-values are nan there)
+            k_d = np.diagonal(Adj_all)
+            nz_d = k_d > 0
+            sig_d = np.zeros(N, bool)
+            sig_d[nz_d] = k_d[nz_d] > stat.binom.isf(q = alpha, n=tau, p=activ_params[nz_d]**2)
+            Adj_sig[np.diag_indices(N)] = sig_d
+    else:
+        Adj_sig = (p_mat < alpha if strict_fallback else p_mat <= alpha).astype(int)
+        print("Caution! 'judge' can take only 'p_val' or 'inv_binom'.")
+        print("Now we calculate significant ties based on p-values.")
+    
+    return {"Adj_sig": Adj_sig,
+            "Adj_all": Adj_all, 
+            "p_mat": p_mat, 
+            "activ_params": activ_params}
+
 
 def ST_filter(A_snap, alpha, 
-              judge='p_val', opt_method='krylov'):
+              judge='p_val', opt_method='krylov',
+              x0=None, tol=None, options=None, backend='numpy'):
     """
     Identifying significant ties from list of adjacency matrix.
     
@@ -60,6 +460,23 @@ def ST_filter(A_snap, alpha,
         Optimization method for nonlinear root finding probrem.
         See method options in 'scipy.optimize.root'.
         https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.root.html#scipy.optimize.root
+        'hybr' and 'lm' use the analytic Jacobian of the objective function,
+        which is slower than 'krylov' for a large network as it forms the Jacobian.
+    x0 : array_like (default is None)
+        Initial guess of activity parameters.
+        Giving 'activ_params' of a previous result on a similar network (warm start)
+        reduces the number of iterations.
+        If None, the configuration model is used for the first guess.
+    tol : float (default is None)
+        Tolerance for termination of root finding. See 'scipy.optimize.root'.
+    options : dict (default is None)
+        Solver options of root finding. See 'scipy.optimize.root'.
+        For 'krylov', {'jac_options': {'inner_M': 'jacobi'}} preconditions the inner solver 
+        by the diagonal of the Jacobian.
+    backend : str (default is 'numpy')
+        Where the function for optimization and p-values are computed.
+        'numpy' : CPU (compiled by Numba)
+        'cupy' : GPU by CuPy, which is effective for a large network (e.g. N >= 10000).
     
     Output
     ------
@@ -74,65 +491,15 @@ def ST_filter(A_snap, alpha,
     """
     
     tau = len(A_snap) # number of snapshots
-    N = len(A_snap[0]) # number of nodes for each matrix
-    
     Adj_all = np.sum(A_snap,axis=0) # Adjacency matrix summing up for all time
-    #Adj_all = csr_matrix(np.sum(A_snap,axis=0)) # sparse ver. Adjacency matrix summing up for all time
     
-    def obj_func(x):
-        """
-        Function for optimization
-        """
-        x = x.reshape(-1,1)
-        ## probability function
-        u = x@x.T
-        obj_mat = (Adj_all - tau*u)/(1-u)
-        H = np.sum(obj_mat, axis=1) - np.diag(obj_mat) # sum up i neq j
-        
-        return H
-    
-    ## configuration model for first guess
-    numer = np.sum(Adj_all, axis=1)/tau
-    denom = np.sqrt(np.sum(Adj_all)/tau)
-    a0 = numer/denom
-    
-    ## estimate activity parameters
-    sol = opt.root(obj_func, x0=a0, method=opt_method)
-    if sol.success == True:
-        print("Root finding method completed successfully.")
-    else:
-        print("Caution! Root finding method failed to find an appropriate solution.")
-        print("The solution could be wrong.")
-    activ_params = sol.x
-    
-    ## construct probability matrix
-    u = activ_params.reshape(-1,1)@activ_params.reshape(1,-1)
-    
-    #Adj_all = Adj_all.toarray()
-    ## calculate p-values
-    p_mat = stat.binom.sf(k = Adj_all, n = tau, p = u)+np.diag(np.nan+np.ones(len(Adj_all))) # diagonal is nan
-    
-    ## compute significant edges
-    if judge == 'p_val':
-        sigs = np.array(p_mat <= alpha, int)
-        Adj_sig = np.array(Adj_all>0,int)*sigs # set 0 if each node pair has no edge in Adj_all
-    elif judge == 'inv_binom':
-        Adj_sig = np.array(Adj_all > stat.binom.isf(q = alpha, n=tau, p=u), int)
-    else:
-        Adj_sig = np.array(p_mat <= alpha, int)
-        print("Caution! 'judge' can take only 'p_val' or 'inv_binom'.")
-        print("Now we calculate significant ties based on p-values.")
-        
-        
-    
-    return {"Adj_sig": Adj_sig,
-            "Adj_all": Adj_all, 
-            "p_mat": p_mat, 
-            "activ_params": activ_params}
+    return _solve(Adj_all, tau, alpha, judge, opt_method,
+                  x0=x0, tol=tol, options=options, backend=backend)
 
 
 def ST_filter_aat(AAT, t, alpha, 
-              judge='p_val', opt_method='krylov'):
+              judge='p_val', opt_method='krylov',
+              x0=None, tol=None, options=None, backend='numpy'):
     """
     Identifying significant ties from aggregate adjacency matrix.
     
@@ -152,6 +519,23 @@ def ST_filter_aat(AAT, t, alpha,
         Optimization method for nonlinear root finding probrem.
         See method options in 'scipy.optimize.root'.
         https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.root.html#scipy.optimize.root
+        'hybr' and 'lm' use the analytic Jacobian of the objective function,
+        which is slower than 'krylov' for a large network as it forms the Jacobian.
+    x0 : array_like (default is None)
+        Initial guess of activity parameters.
+        Giving 'activ_params' of a previous result on a similar network (warm start)
+        reduces the number of iterations.
+        If None, the configuration model is used for the first guess.
+    tol : float (default is None)
+        Tolerance for termination of root finding. See 'scipy.optimize.root'.
+    options : dict (default is None)
+        Solver options of root finding. See 'scipy.optimize.root'.
+        For 'krylov', {'jac_options': {'inner_M': 'jacobi'}} preconditions the inner solver 
+        by the diagonal of the Jacobian.
+    backend : str (default is 'numpy')
+        Where the function for optimization and p-values are computed.
+        'numpy' : CPU (compiled by Numba)
+        'cupy' : GPU by CuPy, which is effective for a large network (e.g. N >= 10000).
     
     Output
     ------
@@ -166,65 +550,16 @@ def ST_filter_aat(AAT, t, alpha,
     """
     
     tau = t # number of snapshots
-    N = len(AAT) # number of nodes for each matrix
-    
-    Adj_all = AAT # Adjacency matrix summing up for all time
-    #Adj_all = csr_matrix(np.sum(A_snap,axis=0)) # sparse ver. Adjacency matrix summing up for all time
-    
-    def obj_func(x):
-        """
-        Function for optimization
-        """
-        x = x.reshape(-1,1)
-        ## probability function
-        u = x@x.T
-        obj_mat = (Adj_all - tau*u)/(1-u)
-        H = np.sum(obj_mat, axis=1) - np.diag(obj_mat) # sum up i neq j
-        
-        return H
+    Adj_all = np.asarray(AAT) # Adjacency matrix summing up for all time
     
-    ## configuration model for first guess
-    numer = np.sum(Adj_all, axis=1)/tau
-    denom = np.sqrt(np.sum(Adj_all)/tau)
-    a0 = numer/denom
-    
-    ## estimate activity parameters
-    sol = opt.root(obj_func, x0=a0, method=opt_method)
-    if sol.success == True:
-        print("Root finding method completed successfully.")
-    else:
-        print("Caution! Root finding method failed to find an appropriate solution.")
-        print("The solution could be wrong.")
-    activ_params = sol.x
-    
-    ## construct probability matrix
-    u = activ_params.reshape(-1,1)@activ_params.reshape(1,-1)
-    
-    #Adj_all = Adj_all.toarray()
-    ## calculate p-values
-    p_mat = stat.binom.sf(k = Adj_all, n = tau, p = u)+np.diag(np.nan+np.ones(len(Adj_all))) # diagonal is nan
-    
-    ## compute significant edges
-    if judge == 'p_val':
-        sigs = np.array(p_mat < alpha, int)
-        Adj_sig = np.array(Adj_all>0,int)*sigs # set 0 if each node pair has no edge in Adj_all
-    elif judge == 'inv_binom':
-        Adj_sig = np.array(Adj_all > stat.binom.isf(q = alpha, n=tau, p=u), int)
-    else:
-        Adj_sig = np.array(p_mat < alpha, int)
-        print("Caution! 'judge' can take only 'p_val' or 'inv_binom'.")
-        print("Now we calculate significant ties based on p-values.")
-        
-        
-    
-    return {"Adj_sig": Adj_sig,
-            "Adj_all": Adj_all, 
-            "p_mat": p_mat, 
-            "activ_params": activ_params}
+    return _solve(Adj_all, tau, alpha, judge, opt_method,
+                  x0=x0, tol=tol, options=options, backend=backend,
+                  strict=True, strict_fallback=True)
 
 def ST_filter_list(edge_list, alpha, 
                    judge='p_val', opt_method='krylov',
-                   memorysave=False, paral=True):
+                   memorysave=False, paral=True,
+                   x0=None, tol=None, options=None, backend='numpy'):
     """
     Identifying significant ties from edge list.
     
@@ -243,12 +578,31 @@ def ST_filter_list(edge_list, alpha,
         Optimization method for nonlinear root finding probrem.
         See method options in 'scipy.optimize.root'.
         https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.root.html#scipy.optimize.root
+        'hybr' and 'lm' use the analytic Jacobian of the objective function,
+        which is slower than 'krylov' for a large network as it forms the Jacobian.
     memorysave : bool (default is 'False')
         If memory error arised, you can choose memory save mode.
         Note1 : if 'memorysave == True', the algorithm is much slower.
         Note2 : When 'memorysave == True', the return value is 'activ_params' only.
     paral : bool (default is 'True')
-        When using memory save mode, parallel computing by threading process is used.
+        When using memory save mode, parallel computing by Numba threads is used.
+    x0 : array_like (default is None)
+        Initial guess of activity parameters.
+        Giving 'activ_params' of a previous result on a similar network (warm start)
+        reduces the number of iterations.
+        If edge_list includes str objects, the order follows 'nodes'.
+        If None, the configuration model is used for the first guess.
+    tol : float (default is None)
+        Tolerance for termination of root finding. See 'scipy.optimize.root'.
+    options : dict (default is None)
+        Solver options of root finding. See 'scipy.optimize.root'.
+        For 'krylov', {'jac_options': {'inner_M': 'jacobi'}} preconditions the inner solver 
+        by the diagonal of the Jacobian.
+    backend : str (default is 'numpy')
+        Where the function for optimization and p-values are computed.
+        'numpy' : CPU (compiled by Numba)
+        'cupy' : GPU by CuPy, which is effective for a large network (e.g. N >= 10000).
+        The adjacency matrix is made dense on GPU. Not used in memory save mode.
     
     
     Output
@@ -260,18 +614,19 @@ def ST_filter_list(edge_list, alpha,
     p_mat : 2D-array_like
         Matrix showing the p-value for each edge in statistical test.
     activ_params : array_like
-        Estimated activity parameter of each node.
+        Estimated activity parameter of each node.    
     
     Output (Additional)
     -------------------
     nodes : array_like (only when edge_list includes str objects)
         Nodes list of the network
-        
+    
     """
     edge_list = np.array(edge_list)
     
-    tau = len(set(edge_list.T[0])) # number of snapshots
-    nodes = list(set(list(set(edge_list.T[1]))+list(set(edge_list.T[2]))))
+    snaps, snap_id = np.unique(edge_list[:,0], return_inverse=True)
+    tau = len(snaps) # number of snapshots
+    nodes, node_id = np.unique(edge_list[:,[1,2]], return_inverse=True)
     N = len(nodes) # number of nodes for each matrix
     
     # allocate node id if including str
@@ -279,162 +634,53 @@ def ST_filter_list(edge_list, alpha,
         edge_list = np.array(edge_list, int)
         in_str = False
     except ValueError: # if edge_list includes strings, replace them to numbers
-        for i in range(N):
-            edge_list = np.where(edge_list==nodes[i], i, edge_list)
-        edge_list = np.array(edge_list,int) # transrate dtype to integer
+        edge_list = np.column_stack([snap_id.reshape(-1), node_id.reshape(-1,2)])
+        nodes = nodes.tolist()
         in_str = True
-        
-        
+    
+    
     if memorysave==False:
         try:        
             ## try algorithm being fast but huge memory needed
-            e_list = edge_list[:,[1,2]]
-            data= np.ones(len(e_list))
-            u_agg_mat = csr_matrix((data, (e_list.T)),shape=(N,N))
-            Adj_all = (u_agg_mat+u_agg_mat.T).toarray()
-
-            def obj_func(x):
-                """
-                Function for optimization
-                """
-                x = x.reshape(-1,1)
-                ## probability function
-                u = x@x.T
-                obj_mat = (Adj_all - tau*u)/(1-u)
-                H = np.sum(obj_mat, axis=1) - np.diag(obj_mat) # sum up i neq j
-
-                return H
-
-            ## configuration model for first guess
-            numer = np.sum(Adj_all, axis=1)/tau
-            denom = np.sqrt(np.sum(Adj_all)/tau)
-            a0 = numer/denom
-
-            ## estimate activity parameters
-            sol = opt.root(obj_func, x0=a0, method=opt_method)
-            if sol.success == True:
-                print("Root finding method completed successfully.")
-            else:
-                print("Caution! Root finding method failed to find an appropriate solution.")
-                print("The solution could be wrong.")
-            activ_params = sol.x
-            ## construct probability matrix
-            u = activ_params.reshape(-1,1)@activ_params.reshape(1,-1)
-
-            ## calculate p-values
-            p_mat = stat.binom.sf(k = Adj_all, n = tau, p = u)+np.diag(np.nan+np.ones(len(Adj_all))) # diagonal is nan
-
-            ## compute significant edges
-            if judge == 'p_val':
-                sigs = np.array(p_mat <= alpha, int)
-                Adj_sig = np.array(Adj_all>0,int)*sigs # set 0 if each node pair has no edge in Adj_all
-            elif judge == 'inv_binom':
-                Adj_sig = np.array(Adj_all > stat.binom.isf(q = alpha, n=tau, p=u), int)
-            else:
-                Adj_sig = np.array(p_mat < alpha, int)
-                print("Caution! 'judge' can take only 'p_val' or 'inv_binom'.")
-                print("Now we calculate significant ties based on p-values.")
-            
-            if in_str == False:
-                resultset = {"Adj_sig": Adj_sig,
-                             "Adj_all": Adj_all, 
-                             "p_mat": p_mat, 
-                             "activ_params": activ_params}
-            else:
-                resultset = {"Adj_sig": Adj_sig,
-                             "Adj_all": Adj_all, 
-                             "p_mat": p_mat, 
-                             "activ_params": activ_params,
-                             "nodes": nodes}
-    
+            A_sym = _sym_csr(edge_list[:,[1,2]], N) # sparse adjacency matrix summing up for all time
+            resultset = _solve(A_sym, tau, alpha, judge, opt_method,
+                               x0=x0, tol=tol, options=options, backend=backend,
+                               strict_fallback=True)
         except MemoryError:
             print('"MemoryError" arised.')
             print('Try memory saving algorithm "memorysave=True" if you wish.')
             # end the algorithm
             return
-        
+    
     else: # memory save mode
         print('Caution! Now using memory saving mode.')
         print('The run time is much slower than the default algorithm.')
         ## if MemoryError appears, use memory saving algolithm 
-        search_list = np.sort(edge_list[:,[1,2]],axis=1)
-
-        if paral == True:
-            from concurrent.futures import ThreadPoolExecutor
-            def obj_func(x):
-                """
-                Function for optimization
-                """ 
-                H = np.zeros(N)
-                def sol(i):
-                    ## probability function
-                    u = x[i]*x
-                    edges = search_list[np.where(search_list==i)[0]]
-                    connected_nodes = np.array(list(set(edges.reshape(-1))))
-                    mij = np.histogram(edges[np.where(edges!=i)],
-                                 bins=N,
-                                 range=(0,N) )[0]
-                    res = (mij-tau*u)/(1-u)
-                    res[i] = 0
-                    return res.sum()
-                with ThreadPoolExecutor() as executor:
-                    result = executor.map(sol,range(N))
-                    H = np.array(list(result))
-
-                return H
-            ## configuration model for first guess
-            numer = np.array([np.sum(edge_list[:,[1,2]]==j) for j in range(len(nodes))])/tau
-            denom = np.sqrt(len(edge_list)*2/tau)
-            a0 = numer/denom
-
-
-            ## estimate activity parameters
-            sol = opt.root(obj_func, x0=a0, method=opt_method)
-            if sol.success == True:
-                print("Root finding method completed successfully.")
-            else:
-                print("Caution! Root finding method failed to find an appropriate solution.")
-                print("The solution could be wrong.")
-                
-        else:
-            def obj_func(x):
-                """
-                Function for optimization
-                """
-                H = np.zeros(N)
-                for i in range(N):
-                    ## probability function
-                    u = x[i]*x
-                    edges = search_list[np.where(search_list==i)[0]]
-                    connected_nodes = np.array(list(set(edges.reshape(-1))))
-                    mij = np.histogram(edges[np.where(edges!=i)],
-                                 bins=N,
-                                 range=(0,N) )[0]
-                    res = (mij-tau*u)/(1-u)
-                    res[i] = 0
-                    H[i] = res.sum()
-
-                return H    
-            ## configuration model for first guess
-            numer = np.array([np.sum(edge_list[:,[1,2]]==j) for j in range(len(nodes))])/tau
+    
+        ## neighbour structure of each node (diagonal is set to 0)
+        indptr, indices, data = _csr_args(_sym_csr(edge_list[:,[1,2]], N))
+    
+        ## configuration model for first guess
+        if x0 is None:
+            numer = np.bincount(edge_list[:,[1,2]].ravel(), minlength=N)/tau
             denom = np.sqrt(len(edge_list)*2/tau)
             a0 = numer/denom
-
-
-            ## estimate activity parameters
-            sol = opt.root(obj_func, x0=a0, method=opt_method)
-            if sol.success == True:
-                print("Root finding method completed successfully.")
-            else:
-                print("Caution! Root finding method failed to find an appropriate solution.")
-                print("The solution could be wrong.")
-        
-        activ_params = sol.x
-        if in_str==False:
-            resultset = {"activ_params": activ_params}
-        else:
-            resultset = {"activ_params": activ_params,
-                         "nodes": nodes}
-        
+        else: # warm start
+            a0 = np.asarray(x0, float)
+    
+        ## estimate activity parameters
+        n_threads = get_num_threads()
+        set_num_threads(config.NUMBA_NUM_THREADS if paral == True else 1)
+        try:        
+            activ_params = _estimate(_residual_csr, a0, (indptr, indices, data, tau),
+                                     opt_method, jac_diag=_jacobian_diag_csr,
+                                     tol=tol, options=options)
+        finally:
+            set_num_threads(n_threads)
+        resultset = {"activ_params": activ_params}
+    
+    if in_str == True:
+        resultset["nodes"] = nodes
+    
     return resultset
 
@@ -6,8 +6,14 @@ setup(
     install_requires=[
         "numpy",
         "scipy",
+        "numba",
         "pandas",
     ],
+    extras_require={
+        "cupy": ["cupy>=13.0.0"], # built from source, prefer the prebuilt wheels below
+        "cuda11x": ["cupy-cuda11x>=13.0.0"],
+        "cuda12x": ["cupy-cuda12x>=13.0.0"],
+    },
     python_requires='>=3',
     author="Yoshitaka Ogisu",
     author_email="yoshitaka.ogisu@gmail.com",